@@ -1,9 +1,12 @@
 import time
 import uuid
+import typing
 import random
 import asyncio
+import logging
 import collections
 import dataclasses
+import collections.abc
 
 from network import message
 from network import mediator
@@ -12,35 +15,48 @@ from app import storage
 from app import security
 
 
-@dataclasses.dataclass
-class _Accepted:
-    value: str
-    proposal: int
+# Reason of the denials caused by a higher proposal
+_PROMISED = "Already promised to a higher proposal"
+
+_Dispatch = collections.abc.Callable[
+    [uuid.UUID, typing.Any],
+    collections.abc.Awaitable[None],
+]
+
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots = True, eq = False)
+class _Acceptor:
+    promised: int | None = None
+    accepted: str = "" # Last accepted value
+    previous: int | None = None # Proposal of the last accepted value
+
+@dataclasses.dataclass(slots = True, eq = False)
 class _Accepting:
     value: str
     accepts: int
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots = True, eq = False)
 class _Proposing:
     value: str
     proposal: int
     promises: int
     maximum: int | None
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots = True, eq = False)
 class _Searching:
     fails: int
     searchers: list[uuid.UUID]
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots = True, eq = False)
 class _Writing:
     value: str
     writer: uuid.UUID
 
 
 class Handler:
+    BACKOFF = 3 # Maximum doublings of the retry delay under contention
+    CAPACITY = 4096 # Maximum pending accepting rounds and searches
+
     def __init__(
         self,
         storage: storage.Storage,
@@ -52,17 +68,76 @@ class Handler:
         self._storage = storage
         self._mediator = mediator
 
+        # Own uid, resolved once instead of per received message
+        self._self = security.Context().uid
+
+        # Low bits of every proposal number, constant for the process
+        self._uid = int.from_bytes(self._self.bytes[:8], byteorder = "big")
+        self._millis = 0 # High bits of the last proposal number
+
         # State
-        self._promised: int | None = None
-        self._accepted: _Accepted | None = None
+        self._attempts = 0 # Consecutive 'Prepare' rounds without a majority
+        self._leader = False # Skips 'Prepare' while no other proposer shows up
+        self._fast: str | None = None # Last value sent through the fast path
+        self._quorum: int | None = None # Proposal with a majority of promises
+        self._acceptor = _Acceptor() # Updated in place, not reallocated
         self._proposing: _Proposing | None = None
-        self._accepting: dict[int, _Accepting] = {}
-        self._searching: dict[str, _Searching] = {}
-        self._writing: collections.deque[_Writing] = collections.deque()
+        self._accepting: collections.OrderedDict[int, _Accepting] = (
+            collections.OrderedDict()
+        )
+        self._searching: collections.OrderedDict[str, _Searching] = (
+            collections.OrderedDict()
+        )
+        self._writing: list[_Writing] = []
+        self._written = 0 # Head of the '_writing' FIFO
 
         # Tasks
         self._proposer: asyncio.Task[None] | None = None
 
+        # Message type to handler table, built once instead of matched per call
+        self._dispatch: dict[type, _Dispatch] = {
+            message.Accept: lambda sender, received: self._on_accept(
+                sender,
+                received.value,
+                received.proposal,
+            ),
+            message.Accepted: lambda sender, received: self._on_accepted(
+                received.value,
+                received.proposal,
+            ),
+            message.Acknowledge: lambda sender, received: (
+                self._on_acknowledge()
+            ),
+            message.Denied: lambda sender, received: self._on_denied(
+                received.reason,
+            ),
+            message.Found: lambda sender, received: self._on_found(
+                received.value,
+                received.found,
+            ),
+            message.Learn: lambda sender, received: self._on_learn(
+                received.value,
+            ),
+            message.Prepare: lambda sender, received: self._on_prepare(
+                sender,
+                received.proposal,
+            ),
+            message.Promise: lambda sender, received: self._on_promise(
+                received.proposal,
+                received.accepted,
+                received.previous,
+            ),
+            message.Search: lambda sender, received: self._on_search(
+                sender,
+                received.value,
+                received.recurse,
+            ),
+            message.Write: lambda sender, received: self._on_write(
+                sender,
+                received.value,
+            ),
+        }
+
     async def handle(
         self,
         sender: uuid.UUID,
@@ -70,31 +145,19 @@ class Handler:
     ) -> None:
         """Dispatches the message to the appropriate handler"""
 
-        match received:
-            case message.Accept():
-                await self._on_accept(sender, received.value, received.proposal)
-            case message.Accepted():
-                await self._on_accepted(received.value, received.proposal)
-            case message.Found():
-                await self._on_found(received.value, received.found)
-            case message.Learn():
-                await self._on_learn(received.value)
-            case message.Prepare():
-                await self._on_prepare(sender, received.proposal)
-            case message.Promise():
-                await self._on_promise(
-                    received.proposal,
-                    received.accepted,
-                    received.previous
-                )
-            case message.Search():
-                await self._on_search(sender, received.value, received.recurse)
-            case message.Write():
-                await self._on_write(sender, received.value)
-            case message.Acknowledge() | message.Denied():
-                pass
-            case _:
-                raise ValueError(f"Unexpected message type: {type(received)}")
+        # Drop the late promises of a round that already reached a majority
+        if (
+            isinstance(received, message.Promise) and
+            received.proposal == self._quorum
+        ):
+            return
+
+        try:
+            dispatch = self._dispatch[type(received)]
+        except KeyError:
+            raise ValueError(f"Unexpected message type: {type(received)}")
+
+        await dispatch(sender, received)
 
     async def _on_accept(
         self,
@@ -104,9 +167,15 @@ class Handler:
     ) -> None:
         """Handles an 'Accept' message"""
 
-        if self._promised is None or proposal >= self._promised:
-            self._promised = proposal
-            self._accepted = _Accepted(value = value, proposal = proposal)
+        if sender != self._self:
+            self._leader = False
+
+        acceptor = self._acceptor
+
+        if acceptor.promised is None or proposal >= acceptor.promised:
+            acceptor.promised = proposal
+            acceptor.accepted = value
+            acceptor.previous = proposal
 
             await self._mediator.quorum(message.Accepted(
                 value = value,
@@ -114,7 +183,7 @@ class Handler:
             ))
         else:
             await self._mediator.send(sender, message.Denied(
-                reason = "Already promised to a higher proposal"
+                reason = _PROMISED
             ))
 
     async def _on_accepted(self, value: str, proposal: int) -> None:
@@ -123,6 +192,12 @@ class Handler:
         if proposal not in self._accepting:
             self._accepting[proposal] = _Accepting(value, 0)
 
+            # Forget the least recently updated round that never got a majority
+            if len(self._accepting) > self.CAPACITY:
+                self._accepting.popitem(last = False)
+        else:
+            self._accepting.move_to_end(proposal)
+
         if value != self._accepting[proposal].value:
             del self._accepting[proposal]
             raise ValueError(f"Duplicate proposal number: {proposal}")
@@ -133,67 +208,106 @@ class Handler:
             del self._accepting[proposal]
             await self._mediator.quorum(message.Learn(value = value))
 
+    async def _on_acknowledge(self) -> None:
+        """Handles an 'Acknowledge' message"""
+
+    async def _on_denied(self, reason: str) -> None:
+        """Handles a 'Denied' message"""
+
+        # Another proposer is active, the fast path is no longer safe
+        if reason == _PROMISED:
+            self._leader = False
+
     async def _on_found(self, value: str, found: bool) -> None:
         """Handles a 'Found' message"""
 
-        if value not in self._searching:
-            return
+        # Single lookup, the entry is then updated in place
+        searching = self._searching.get(value)
 
-        searchers = self._searching[value].searchers
+        if searching is None:
+            return
 
         if found:
             del self._searching[value]
             response = message.Found(value = value, found = True)
 
-            for searcher in searchers:
-                await self._mediator.send(searcher, response)
+            await self._mediator.multicast(searching.searchers, response)
 
             return
 
-        self._searching[value].fails += 1
+        searching.fails += 1
+        self._searching.move_to_end(value)
 
-        if self._searching[value].fails >= self._mediator.majority:
+        if searching.fails >= self._mediator.majority:
             del self._searching[value]
             response = message.Found(value = value, found = False)
 
-            for searcher in searchers:
-                await self._mediator.send(searcher, response)
+            await self._mediator.multicast(searching.searchers, response)
 
     async def _on_learn(self, value: str) -> None:
         """Handles a 'Learn' message"""
 
-        self._storage.add(value)
+        # Every node with a majority broadcasts 'Learn', only the first one
+        # stores the value and resets the round
+        learned = value not in self._storage
+
+        if learned:
+            self._storage.add(value)
+
+        # Hoisted out of the loop below
+        writing = self._writing
+        stored = self._storage.__contains__
 
-        while self._writing and self._writing[0].value in self._storage:
-            dequeued = self._writing.popleft()
+        # Whether the learned value is the one this node was proposing
+        own = self._written < len(writing) and (
+            writing[self._written].value == value
+        )
+
+        drained = False
+
+        while self._written < len(writing) and stored(
+            writing[self._written].value
+        ):
+            dequeued = writing[self._written]
+            self._written += 1
+            drained = True
 
             await self._mediator.send(dequeued.writer, message.Wrote(
                 value = dequeued.value
             ))
 
-        self._reset()
+        # Compact the FIFO once most of it was already consumed
+        if self._written > len(self._writing) // 2:
+            del self._writing[:self._written]
+            self._written = 0
+
+        if learned:
+            self._reset(own)
+
+        # A round that adopted an already decided value only ends with the
+        # duplicates, the pending writes still need a proposer afterwards
+        elif drained or self._proposer is None:
+            self._restart()
 
     async def _on_prepare(self, sender: uuid.UUID, proposal: int) -> None:
         """Handles a 'Prepare' message"""
 
-        if self._promised is None or proposal > self._promised:
-            self._promised = proposal
+        if sender != self._self:
+            self._leader = False
 
-            if self._accepted is None:
-                accepted = ""
-                previous = None
-            else:
-                accepted = self._accepted.value
-                previous = self._accepted.proposal
+        acceptor = self._acceptor
+
+        if acceptor.promised is None or proposal > acceptor.promised:
+            acceptor.promised = proposal
 
             await self._mediator.send(sender, message.Promise(
-                proposal = self._promised,
-                accepted = accepted,
-                previous = previous,
+                proposal = proposal,
+                accepted = acceptor.accepted,
+                previous = acceptor.previous,
             ))
         else:
             await self._mediator.send(sender, message.Denied(
-                reason = "Already promised to a higher proposal"
+                reason = _PROMISED
             ))
 
     async def _on_promise(
@@ -218,6 +332,9 @@ class Handler:
         if self._proposing.promises >= self._mediator.majority:
             value = self._proposing.value
             self._proposing = None
+            self._quorum = proposal
+            self._attempts = 0
+            self._leader = True
 
             # Stop proposing for this round
             if self._proposer is not None:
@@ -238,11 +355,21 @@ class Handler:
         """Handles a 'Search' message"""
 
         if recurse:
-            if value not in self._searching:
-                self._searching[value] = _Searching(fails = 0, searchers = [])
+            searching = self._searching.get(value)
+
+            if searching is None:
+                searching = _Searching(fails = 0, searchers = [])
+                self._searching[value] = searching
 
-            self._searching[value].searchers.append(sender)
-            started = len(self._searching[value].searchers) == 1
+                # Drop the least recently updated search without replying
+                if len(self._searching) > self.CAPACITY:
+                    evicted, _ = self._searching.popitem(last = False)
+                    logging.warning(f"Dropped pending search: {evicted}")
+            else:
+                self._searching.move_to_end(value)
+
+            searching.searchers.append(sender)
+            started = len(searching.searchers) == 1
 
             await self._mediator.send(sender, message.Acknowledge())
 
@@ -266,25 +393,46 @@ class Handler:
             ))
 
         await self._mediator.send(sender, message.Acknowledge())
+
+        # Already decided, no round needed
+        if value in self._storage:
+            return await self._mediator.send(sender, message.Wrote(
+                value = value
+            ))
+
         self._writing.append(_Writing(value = value, writer = sender))
 
         # Start the task to propose the value
         if self._proposer is None:
-            value = self._writing[0].value
+            value = self._writing[self._written].value
             self._proposer = asyncio.create_task(self._propose(value))
 
-    @staticmethod
-    def _proposal() -> int:
-        """Returns a new proposal number"""
-
-        now = int(time.time() * 1000).to_bytes(8, byteorder = "big")
-        uid = security.Context().uid.bytes[:8]
+    def _proposal(self) -> int:
+        """Returns a new proposal number, strictly increasing on this node"""
 
-        return int.from_bytes(now + uid, byteorder = "big")
+        # Same millisecond calls and clock steps back must not repeat numbers
+        self._millis = max(int(time.time() * 1000), self._millis + 1)
+        return self._millis << 64 | self._uid
 
     async def _propose(self, value: str) -> None:
         """Repeatedly sends 'Prepare' messages until canceled"""
 
+        # Multi-Paxos fast path: a stable leader goes straight to 'Accept',
+        # once per value so restarted proposers do not repeat it
+        if self._leader and value != self._fast:
+            self._fast = value
+
+            await self._mediator.quorum(message.Accept(
+                value = value,
+                proposal = self._proposal(),
+            ))
+
+            delay = random.uniform(self._delays[0], self._delays[1])
+            await asyncio.sleep(delay)
+
+            # No decision was reached, recover with a full round
+            self._leader = False
+
         while True:
             self._proposing = _Proposing(
                 promises = 0,
@@ -297,21 +445,36 @@ class Handler:
                 proposal = self._proposing.proposal
             ))
 
-            delay = random.uniform(self._delays[0], self._delays[1])
+            # Exponential backoff with jitter to break dueling proposers
+            scale = 2 ** min(self._attempts, self.BACKOFF)
+            self._attempts += 1
+
+            delay = random.uniform(self._delays[0], self._delays[1] * scale)
             await asyncio.sleep(delay)
 
-    def _reset(self) -> None:
+    def _reset(self, own: bool) -> None:
         """Resets the internal state to go to the next round"""
 
-        self._promised = None
-        self._accepted = None
+        # Leadership only holds while the learned values are this node's own
+        if not own:
+            self._leader = False
+
+        acceptor = self._acceptor
+        acceptor.promised = None
+        acceptor.accepted = ""
+        acceptor.previous = None
+
         self._proposing = None
         self._accepting.clear()
+        self._restart()
+
+    def _restart(self) -> None:
+        """Proposes the head of the writing FIFO, if any value is pending"""
 
         if self._proposer is not None:
             self._proposer.cancel()
             self._proposer = None
 
-        if self._writing:
-            value = self._writing[0].value
+        if self._written < len(self._writing):
+            value = self._writing[self._written].value
             self._proposer = asyncio.create_task(self._propose(value))
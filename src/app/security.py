@@ -1,8 +1,11 @@
 import os
+import hmac
 import uuid
 import typing
 import hashlib
+import functools
 import dataclasses
+import collections.abc
 
 from util import error
 from util import singleton
@@ -21,6 +24,9 @@ class Context(metaclass = singleton.Singleton):
         self._secret = secret
         self._uid = uuid.uuid4()
 
+        # Digest state after the secret, copied instead of rehashing it
+        self._keyed = hashlib.sha256(secret.encode())
+
     @property
     def uid(self) -> uuid.UUID:
         return self._uid
@@ -29,8 +35,13 @@ class Context(metaclass = singleton.Singleton):
     def secret(self) -> str:
         return self._secret
 
+    @property
+    def keyed(self) -> "hashlib._Hash":
+        """Fresh digest already fed with the secret"""
+        return self._keyed.copy()
+
 
-@dataclasses.dataclass(frozen = True, kw_only = True)
+@dataclasses.dataclass(frozen = True, kw_only = True, slots = True)
 class Authenticated:
     hash: str = ""
 
@@ -39,29 +50,47 @@ class Authenticated:
             object.__setattr__(self, "hash", hash(self))
 
 
+def _encode_int(value: int) -> bytes:
+    return value.to_bytes(16, "big")
+
+# Exact type lookups instead of matching the patterns one by one
+_ENCODERS: dict[type, collections.abc.Callable[[typing.Any], bytes]] = {
+    type(None): lambda value: b"",
+    bool: _encode_int,
+    int: _encode_int,
+    str: str.encode,
+    bytes: lambda value: value,
+}
+
 def _encode(value: typing.Any) -> bytes:
-    match value:
-        case None:
-            return b""
-        case int():
-            return value.to_bytes(16, "big")
-        case str():
-            return value.encode()
-        case bytes():
-            return value
-
-    raise ValueError(f"Unable to encode type: {type(value)}")
+    try:
+        encode = _ENCODERS[type(value)]
+    except KeyError:
+        raise ValueError(f"Unable to encode type: {type(value)}") from None
+
+    return encode(value)
+
+@functools.cache
+def _fields(cls: type[Authenticated]) -> tuple[str, ...]:
+    """Hashed field names of the class, in declaration order"""
+
+    fields = dataclasses.fields(cls)
+    return tuple(field.name for field in fields if field.name != "hash")
 
 def hash(authenticated: Authenticated) -> str:
-    items = dataclasses.asdict(authenticated).items()
-    values = (value for field, value in items if field != "hash")
+    hash = Context().keyed
+    update = hash.update
 
-    hash = hashlib.sha256(
-        _encode(Context().secret) +
-        b"".join(_encode(value) for value in values)
-    )
+    # Streamed into the digest, no joined buffer per message
+    for field in _fields(type(authenticated)):
+        update(_encode(getattr(authenticated, field)))
 
     return hash.hexdigest()
 
 def authenticate(authenticated: Authenticated) -> bool:
-    return hash(authenticated) == authenticated.hash
+    # Constant time, the comparison does not leak the matching prefix. Bytes
+    # since a forged hash may hold non-ASCII characters, which str rejects
+    return hmac.compare_digest(
+        hash(authenticated).encode(),
+        authenticated.hash.encode(),
+    )
@@ -1,8 +1,14 @@
+import os
+import asyncio
+import logging
 import pathlib
 import collections.abc
+import concurrent.futures
 
 
 class Storage(collections.abc.Set):
+    FLUSH_DELAY = 0.01 # Seconds during which added values share one fsync
+
     def __init__(
         self,
         filepath: pathlib.Path,
@@ -13,20 +19,84 @@ class Storage(collections.abc.Set):
         self._filepath = directory / filepath
         self._values: set[str] = set()
 
+        # Exactly the written lines: split() and splitlines() also break on,
+        # and strip() removes, characters such as '\x0c' that values may hold
         if self._filepath.is_file():
-            with self._filepath.open() as file:
-                for line in file:
-                    if striped := line.strip():
-                        self._values.add(striped)
+            text = self._filepath.read_text(encoding = "utf-8")
+            self._values.update(filter(None, text.split("\n")))
+
+        # Kept open, each value is a single appending write
+        self._fd = os.open(
+            self._filepath,
+            os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+            0o644,
+        )
+
+        self._flush: asyncio.TimerHandle | None = None
+
+        # Single worker, the grouped syncs run in order off the event loop
+        self._syncer = concurrent.futures.ThreadPoolExecutor(max_workers = 1)
 
     def add(self, value: str) -> None:
         """Adds the value to the permanent storage"""
 
-        if value not in self:
-            with self._filepath.open("a") as file:
-                file.write(f"{value}\n")
+        if self._fd < 0:
+            raise ValueError("Storage already closed")
 
+        if value not in self._values:
+            os.write(self._fd, f"{value}\n".encode())
             self._values.add(value)
+            self._schedule()
+
+    def flush(self) -> None:
+        """Forces the written values to disk"""
+
+        if self._flush is not None:
+            self._flush.cancel()
+            self._flush = None
+
+        os.fsync(self._fd)
+
+    def close(self) -> None:
+        """Flushes and closes the storage file"""
+
+        if self._fd < 0:
+            return
+
+        # Waits for the syncs already handed to the worker
+        self._syncer.shutdown(wait = True)
+
+        self.flush()
+        os.close(self._fd)
+        self._fd = -1
+
+    def _schedule(self) -> None:
+        """Groups the values added in a short window into a single fsync"""
+
+        if self._flush is not None:
+            return
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return self.flush()
+
+        self._flush = loop.call_later(self.FLUSH_DELAY, self._sync)
+
+    def _sync(self) -> None:
+        """Hands the grouped fsync to the worker thread"""
+
+        self._flush = None
+
+        synced = self._syncer.submit(os.fsync, self._fd)
+        synced.add_done_callback(self._synced)
+
+    @staticmethod
+    def _synced(synced: concurrent.futures.Future) -> None:
+        """Reports a failed background fsync, the values may not be durable"""
+
+        if (exception := synced.exception()) is not None:
+            logging.error(f"Failed to sync the storage: {exception}")
 
     def __len__(self) -> int:
         return len(self._values)
@@ -36,3 +106,9 @@ class Storage(collections.abc.Set):
 
     def __contains__(self, value: object) -> bool:
         return value in self._values
+
+    def __enter__(self) -> "Storage":
+        return self
+
+    def __exit__(self, type, value, traceback) -> None:
+        self.close()
@@ -4,6 +4,8 @@ import asyncio
 import logging
 import aioconsole # type: ignore
 
+from util import log
+from util import loop
 from util import error
 
 from network import host
@@ -27,11 +29,13 @@ def on_fail() -> None:
     error.exit(f"Lost connection to the server")
 
 def on_receive(received: message.Message) -> None:
-    logging.info(f"Received message: {received}")
+    logging.info("Received message: %s", received)
 
 
 async def main() -> None:
-    logging.root.level = logging.INFO
+    log.setup(logging.INFO)
+    loop.setup()
+
     parsed = cli.Parser().client.parse_args()
 
     async with connection.Connection() as connected:
@@ -43,7 +47,7 @@ async def main() -> None:
                 host = parsed.host,
                 handshake = handshake,
                 on_fail = on_connect_fail,
-                delays = [0.1, 1.0, 2.0, 5.0],
+                delays = connection.Backoff(),
             )
         except Exception:
             error.exit("Failed to connect to the server")
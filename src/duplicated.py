@@ -4,6 +4,8 @@ import uuid
 import asyncio
 import logging
 
+from util import log
+from util import loop
 from util import error
 
 from network import host
@@ -20,11 +22,12 @@ def on_fail() -> None:
     error.exit(f"Lost connection to the server")
 
 def on_receive(sender: uuid.UUID, received: message.Message) -> None:
-    logging.info(f"Received message: {received}")
+    logging.info("Received message: %s", received)
 
 
 async def main() -> None:
-    logging.root.level = logging.INFO
+    log.setup(logging.INFO)
+    loop.setup()
     parsed = cli.Parser().duplicated.parse_args()
 
     async with connection.Map() as connections:
@@ -49,7 +52,7 @@ async def main() -> None:
         await connection.connectall(
             handshake = handshake,
             on_fail = on_connect_fail,
-            delays = [0.1, 1.0, 2.0, 5.0],
+            delays = connection.Backoff(),
             hosts = [parsed.first, parsed.second],
         )
 
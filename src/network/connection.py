@@ -1,6 +1,11 @@
 import uuid
+import random
+import socket
 import typing
 import asyncio
+import logging
+import collections
+import dataclasses
 import collections.abc
 
 from util import callback
@@ -14,37 +19,95 @@ OnFail = callback.Handler[[Exception, host.Host, int]]
 Native = tuple[asyncio.StreamReader, asyncio.StreamWriter]
 Handshake = callback.Handler[[asyncio.StreamReader, asyncio.StreamWriter]]
 
+_encode = message.encode # Not shadowed by the 'message' parameters
+
+_OnFail = callback.Callback[[Exception, host.Host, int]]
+_Handshake = callback.Callback[[asyncio.StreamReader, asyncio.StreamWriter]]
+
+# Connection errors worth another attempt, anything else fails right away
+_RECOVERABLE = (OSError, EOFError, asyncio.TimeoutError)
+
+# Bytes buffered by a StreamReader before pausing its transport
+LIMIT = 1024 * 1024
+
+
+@dataclasses.dataclass(frozen = True)
+class Backoff:
+    """Exponential retry delays with jitter, usable wherever Delays is"""
+
+    base: float = 0.5
+    factor: float = 2.0
+    cap: float = 5.0
+    jitter: float = 0.5
+    attempts: int = 5
+
+    def __iter__(self) -> collections.abc.Iterator[float]:
+        for attempt in range(self.attempts):
+            delay = min(self.cap, self.base * self.factor ** attempt)
+            yield delay * (1 + random.uniform(-self.jitter, self.jitter))
+
 
 async def connect(
     host: host.Host,
     delays: Delays,
-    handshake: Handshake = None,
-    on_fail: OnFail = None,
+    handshake: Handshake | _Handshake = None,
+    on_fail: OnFail | _OnFail = None,
+    timeout: float = 5.0,
 ) -> Native:
     """Creates a single connection"""
 
-    # Convert the handlers to callbacks
-    handshake = callback.Callback(handshake)
-    on_fail = callback.Callback(on_fail)
+    # Convert the handlers to callbacks, unless they already are
+    if not isinstance(handshake, callback.Callback):
+        handshake = callback.Callback(handshake)
+
+    if not isinstance(on_fail, callback.Callback):
+        on_fail = callback.Callback(on_fail)
 
     address = host.addresses[0]
     fails = 0
 
+    # Each delay is waited after a failure, before the next attempt
+    waiting: float | None = None
+
     for delay in delays:
-        await asyncio.sleep(delay)
+        if waiting is not None:
+            await asyncio.sleep(waiting)
+
+        writer: asyncio.StreamWriter | None = None
 
         try:
-            reader, writer = await asyncio.open_connection(
-                address.address,
-                address.port.number,
+            # Bound each attempt instead of waiting before it
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(
+                    address.address,
+                    address.port.number,
+                    limit = LIMIT,
+                ),
+                timeout,
             )
 
-            await handshake(reader, writer)
+            # A peer that accepts but never answers must not hang either
+            if handshake:
+                await asyncio.wait_for(handshake(reader, writer), timeout)
+
             return reader, writer
+        except asyncio.CancelledError:
+            if writer is not None:
+                writer.close()
+
+            raise
         except Exception as exception:
+            if writer is not None:
+                writer.close()
+
             fails += 1
             await on_fail(exception, host, fails)
 
+            if not isinstance(exception, _RECOVERABLE):
+                break
+
+        waiting = delay
+
     raise ConnectionError(f"Failed to connect to {host}")
 
 async def connectall(
@@ -52,17 +115,36 @@ async def connectall(
     delays: Delays,
     handshake: Handshake = None,
     on_fail: OnFail = None,
+    timeout: float = 5.0,
+    concurrency: int = 64,
 ) -> list[Native]:
-    """Creates multiple connections"""
+    """Creates multiple connections, at most 'concurrency' at a time"""
+
+    limit = asyncio.Semaphore(concurrency)
+
+    # Wrap the handlers once for all the hosts
+    shake = callback.Callback(handshake)
+    fail = callback.Callback(on_fail)
+
+    async def bounded(host: host.Host) -> Native:
+        async with limit:
+            return await connect(host, delays, shake, fail, timeout)
+
+    results = await asyncio.gather(
+        *(bounded(host) for host in hosts),
+        return_exceptions = True,
+    )
 
-    tasks = [connect(host, delays, handshake, on_fail) for host in hosts]
     connections: list[Native] = []
 
-    for future in asyncio.as_completed(tasks):
-        try:
-            connections.append(await future)
-        except ConnectionError:
-            pass
+    for result in results:
+        if isinstance(result, ConnectionError):
+            continue
+
+        if isinstance(result, BaseException):
+            raise result
+
+        connections.append(result)
 
     return connections
 
@@ -73,7 +155,18 @@ class Connection:
     OnFail = callback.Callback[[]]
     OnReceive = callback.Callback[[message.Message]]
 
-    def __init__(self) -> None:
+    # Write buffer watermarks in bytes, sends only wait above the high one
+    LOW_WATER = 64 * 1024
+    HIGH_WATER = 256 * 1024
+
+    READ_SIZE = 64 * 1024 # Maximum bytes read from the stream at once
+    KEEPALIVE = 30 # Idle seconds before probing the peer
+    CLOSE_TIMEOUT = 5.0 # Seconds to consume the queues before aborting
+
+    def __init__(self, yield_every: int = 1000) -> None:
+        # Configuration
+        self._yield_every = yield_every # Messages handled between yields
+
         # Connection streams
         self._writer: asyncio.StreamWriter | None = None
         self._reader: asyncio.StreamReader | None = None
@@ -81,8 +174,16 @@ class Connection:
 
         # Queues and events
         self._failed = asyncio.Event()
-        self._sending: asyncio.Queue[message.Message] = asyncio.Queue()
-        self._received: asyncio.Queue[message.Message] = asyncio.Queue()
+        self._sending: collections.deque[bytes] = collections.deque() # encoded
+        self._received: collections.deque[message.Message] = collections.deque()
+
+        self._sending_ready = asyncio.Event() # Set when there are queued sends
+        self._sending_done = asyncio.Event() # Set when all sends were consumed
+        self._received_ready = asyncio.Event()
+        self._received_done = asyncio.Event()
+
+        self._sending_done.set()
+        self._received_done.set()
 
         # Tasks
         self._sender: asyncio.Task[None] | None = None
@@ -102,7 +203,7 @@ class Connection:
 
         # Consume the queued sends
         if self._writer is not None:
-            await self._sending.join()
+            await self._sending_done.wait()
 
         # Cancel the previously associated sender task
         if self._sender is not None:
@@ -118,6 +219,24 @@ class Connection:
 
         # Associate a new sender task
         if self._writer is not None:
+            self._writer.transport.set_write_buffer_limits(
+                high = self.HIGH_WATER,
+                low = self.LOW_WATER,
+            )
+
+            # Long-lived, so a silently dead peer must fail by itself
+            sock = self._writer.get_extra_info("socket")
+
+            if sock is not None:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+                if hasattr(socket, "TCP_KEEPIDLE"): # Not on every platform
+                    sock.setsockopt(
+                        socket.IPPROTO_TCP,
+                        socket.TCP_KEEPIDLE,
+                        self.KEEPALIVE,
+                    )
+
             self._sender = asyncio.create_task(self._send())
 
     async def set_reader(
@@ -152,7 +271,14 @@ class Connection:
 
     async def send(self, message: message.Message) -> None:
         """Enqueues a message to be sent"""
-        await self._sending.put(message)
+        self.enqueue(_encode(message))
+
+    def enqueue(self, frame: bytes) -> None:
+        """Enqueues an encoded frame without waiting for it to be sent"""
+
+        self._sending.append(frame)
+        self._sending_done.clear()
+        self._sending_ready.set()
 
     async def on_receive(
         self,
@@ -162,7 +288,7 @@ class Connection:
 
         if self._notifier is not None:
             # Consume the queued receives
-            await self._received.join()
+            await self._received_done.wait()
 
             # Cancel the previously associated notifier task
             self._notifier.cancel()
@@ -170,54 +296,148 @@ class Connection:
 
         self._on_receive.handler = handler
 
+        if not self._on_receive:
+            return
+
+        # Synchronous handlers are called by the receiver task itself
+        if self._on_receive.synchronous:
+            while self._received:
+                self._on_receive.call(self._received.popleft())
+
+            self._received_done.set()
+            return
+
         # Associate a new notifier task
-        if self._on_receive:
-            self._notifier = asyncio.create_task(self._notifiy())
+        self._notifier = asyncio.create_task(self._notifiy())
 
     def on_fail(self, handler: callback.Handler[[]]) -> None:
         """Sets the callback for failed operations"""
         self._on_fail.handler = handler
 
     async def close(self) -> None:
-        """Closes the current connection"""
+        """Closes the current connection, aborting it if it takes too long"""
+
+        try:
+            await asyncio.wait_for(self._close(), self.CLOSE_TIMEOUT)
+        except asyncio.TimeoutError:
+            await self.abort()
+
+    async def abort(self) -> None:
+        """Closes the current connection dropping the queued messages"""
+
+        tasks = [
+            task for task in (
+                self._sender,
+                self._receiver,
+                self._notifier,
+                self._aborter,
+            )
+            if task is not None and task is not asyncio.current_task()
+        ]
+
+        # Cancel the tasks first so none of them waits on a dead peer
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions = True)
+
+        for writer in {self._writer, self._associated} - {None}:
+            typing.cast(asyncio.StreamWriter, writer).close()
+
+        self._sender = self._receiver = self._notifier = None
+        self._writer = self._reader = self._associated = None
+
+        self._sending.clear()
+        self._received.clear()
+        self._sending_done.set()
+        self._received_done.set()
+
+    async def _close(self) -> None:
+        """Closes the current connection after consuming the queues"""
         await self.set_reader(None)
         await self.set_writer(None)
         await self.on_receive(None)
         self._aborter.cancel()
 
     async def _send(self) -> None:
-        """Waits in the queue for a message to be sent and consumes it"""
+        """Waits in the queue for messages to be sent and consumes them"""
         writer = typing.cast(asyncio.StreamWriter, self._writer)
 
         while True:
-            dequeued = await self._sending.get()
+            await self._sending_ready.wait()
+            self._sending_ready.clear()
 
-            try:
-                await message.send(writer, dequeued)
-            except Exception:
-                self._failed.set()
+            while self._sending:
+                # Coalesce the queued messages into a single write
+                count = min(len(self._sending), self._yield_every)
+                dequeued = [self._sending.popleft() for _ in range(count)]
+
+                try:
+                    writer.writelines(dequeued)
+
+                    # Also drains a closing writer to surface its error
+                    if (
+                        writer.is_closing() or
+                        writer.transport.get_write_buffer_size() >=
+                        self.HIGH_WATER
+                    ):
+                        await writer.drain()
+                except Exception:
+                    self._failed.set()
 
-            self._sending.task_done()
+                # Let other tasks run between large batches
+                if self._sending:
+                    await asyncio.sleep(0)
+
+            self._sending_done.set()
 
     async def _receive(self) -> None:
         """Waits for messages and populates the received queue"""
         reader = typing.cast(asyncio.StreamReader, self._reader)
+        buffer = bytearray()
+        handled = 0
 
         while True:
+            # Read whatever is available and decode all the complete frames
             try:
-                received = await message.receive(reader)
+                chunk = await reader.read(self.READ_SIZE)
+
+                if not chunk:
+                    raise EOFError("Connection closed by the peer")
+
+                buffer += chunk
+                decoded = message.decode_frames(buffer)
             except Exception:
                 return self._failed.set()
 
-            await self._received.put(received)
+            # Skip the queue and the notifier task for synchronous handlers
+            if self._on_receive and self._on_receive.synchronous:
+                for received in decoded:
+                    self._on_receive.call(received)
+                    handled += 1
+
+                    # Buffered reads do not await, yield once in a while
+                    if handled % self._yield_every == 0:
+                        await asyncio.sleep(0)
+
+                continue
+
+            if decoded:
+                self._received.extend(decoded)
+                self._received_done.clear()
+                self._received_ready.set()
 
     async def _notifiy(self) -> None:
-        """Waits in the queue for a received message and consumes it"""
+        """Waits in the queue for received messages and consumes them"""
 
         while True:
-            dequeued = await self._received.get()
-            await self._on_receive(dequeued)
-            self._received.task_done()
+            await self._received_ready.wait()
+            self._received_ready.clear()
+
+            while self._received:
+                await self._on_receive(self._received.popleft())
+
+            self._received_done.set()
 
     async def _abort(self) -> None:
         """Waits for the failed event and closes the connection if it happens"""
@@ -241,11 +461,15 @@ class Map(collections.abc.Sized, collections.abc.Container):
     _Received = tuple[uuid.UUID, message.Message]
 
     def __init__(self) -> None:
-        # Connections
-        self._connections: dict[uuid.UUID, Connection] = {}
+        # Connections, keyed by the uid int which hashes faster than the UUID
+        self._connections: dict[int, Connection] = {}
+
+        # Queues and events
+        self._received: collections.deque[Map._Received] = collections.deque()
+        self._received_ready = asyncio.Event()
+        self._received_done = asyncio.Event()
 
-        # Queues
-        self._received: asyncio.Queue[Map._Received] = asyncio.Queue()
+        self._received_done.set()
 
         # Tasks
         self._notifier: asyncio.Task[None] | None = None
@@ -264,7 +488,7 @@ class Map(collections.abc.Sized, collections.abc.Container):
         if uid not in self:
             await self._add(uid)
 
-        await self._connections[uid].set_writer(writer)
+        await self._connections[uid.int].set_writer(writer)
 
     async def set_reader(
         self,
@@ -277,17 +501,36 @@ class Map(collections.abc.Sized, collections.abc.Container):
         if uid not in self:
             await self._add(uid)
 
-        await self._connections[uid].set_reader(reader, associated)
+        await self._connections[uid.int].set_reader(reader, associated)
 
     async def send(self, uid: uuid.UUID, message: message.Message) -> None:
         """Sends the message to the connection with the uid"""
-        await self._connections[uid].send(message)
+        await self._connections[uid.int].send(message)
 
     async def broadcast(self, message: message.Message) -> None:
         """Sends the message to all the connections"""
-        await asyncio.gather(
-            *(self.send(uid, message) for uid in self._connections)
-        )
+
+        # Encoded once for every peer since they all get the same bytes
+        encoded = _encode(message)
+
+        # Fire and forget, the sender tasks handle the backpressure
+        for connection in self._connections.values():
+            connection.enqueue(encoded)
+
+    async def multicast(
+        self,
+        uids: collections.abc.Iterable[uuid.UUID],
+        message: message.Message,
+    ) -> None:
+        """Sends the message to the connections with the uids, if present"""
+
+        encoded = _encode(message)
+
+        for uid in uids:
+            connection = self._connections.get(uid.int)
+
+            if connection is not None:
+                connection.enqueue(encoded)
 
     async def on_receive(
         self,
@@ -297,7 +540,7 @@ class Map(collections.abc.Sized, collections.abc.Container):
 
         if self._notifier is not None:
             # Consume the queued receives
-            await self._received.join()
+            await self._received_done.wait()
 
             # Cancel the previously associated notifier task
             self._notifier.cancel()
@@ -315,14 +558,25 @@ class Map(collections.abc.Sized, collections.abc.Container):
 
     async def close(self, uid: uuid.UUID) -> None:
         """Closes the connection with the uid"""
-        await self._connections[uid].close()
-        del self._connections[uid]
+        await self._connections[uid.int].close()
+        del self._connections[uid.int]
 
     async def clear(self) -> None:
         """Closes all the connections"""
 
-        uids = list(self._connections.keys()) # Allow removing while iterating
-        await asyncio.gather(*(self.close(uid) for uid in uids))
+        # Detach all at once, no deletions race with the concurrent closes
+        connections = list(self._connections.items())
+        self._connections.clear()
+
+        results = await asyncio.gather(
+            *(connection.close() for _, connection in connections),
+            return_exceptions = True,
+        )
+
+        for (key, _), result in zip(connections, results):
+            if isinstance(result, Exception):
+                uid = uuid.UUID(int = key)
+                logging.warning(f"Failed to close connection [{uid}]: {result}")
 
         await self.on_receive(None)
 
@@ -331,31 +585,42 @@ class Map(collections.abc.Sized, collections.abc.Container):
 
         async def on_fail() -> None:
             if uid in self:
-                del self._connections[uid]
+                del self._connections[uid.int]
                 await self._on_fail(uid)
 
-        async def on_receive(message: message.Message) -> None:
-            await self._received.put((uid, message))
+        def on_receive(message: message.Message) -> None:
+            self._received.append((uid, message))
+            self._received_done.clear()
+            self._received_ready.set()
 
         connection = Connection()
         connection.on_fail(on_fail)
         await connection.on_receive(on_receive)
 
-        self._connections[uid] = connection
+        self._connections[uid.int] = connection
 
     async def _notifiy(self) -> None:
-        """Waits in the queue for a received message and consumes it"""
+        """Waits in the queue for received messages and consumes them"""
 
         while True:
-            dequeued = await self._received.get()
-            await self._on_receive(*dequeued)
-            self._received.task_done()
+            await self._received_ready.wait()
+            self._received_ready.clear()
+
+            while self._received:
+                dequeued = self._received.popleft()
+
+                if self._on_receive.synchronous:
+                    self._on_receive.call(*dequeued)
+                else:
+                    await self._on_receive(*dequeued)
+
+            self._received_done.set()
 
     def __len__(self) -> int:
         return len(self._connections)
 
     def __contains__(self, key: object) -> bool:
-        return key in self._connections
+        return isinstance(key, uuid.UUID) and key.int in self._connections
 
     async def __aenter__(self) -> "Map":
         return self
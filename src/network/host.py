@@ -1,114 +1,102 @@
 import re
 import socket
+import typing
 import pathlib
+import functools
 import dataclasses
 
 
+@dataclasses.dataclass(frozen = True, slots = True)
 class Port:
     """Wrapper to represent a port with a valid number"""
 
-    LOW = 1
-    HIGH = 65535
+    LOW: typing.ClassVar[int] = 1
+    HIGH: typing.ClassVar[int] = 65535
 
-    def __init__(self, number: int) -> None:
-        if number < self.LOW or number > self.HIGH:
+    number: int
+
+    def __post_init__(self) -> None:
+        if self.number < self.LOW or self.number > self.HIGH:
             raise ValueError(
-                f"Port out of range [{self.LOW}, {self.HIGH}]: {number}"
+                f"Port out of range [{self.LOW}, {self.HIGH}]: {self.number}"
             )
 
-        self._number = number
-
     @classmethod
+    @functools.lru_cache(maxsize = 256)
     def from_str(cls, number: str) -> "Port":
-        if not number.isdigit():
+        # ASCII digits only, int() alone accepts signs, spaces and underscores
+        if not (number.isascii() and number.isdigit()):
             raise ValueError(f"Invalid unsigned int: {number}")
 
         return cls(int(number))
 
-    @property
-    def number(self):
-        return self._number
-
     def __str__(self) -> str:
-        return str(self._number)
+        return str(self.number)
 
 
-@dataclasses.dataclass(frozen = True)
-class Address:
-    """Object-like representation of the tuple returned by socket.getaddrinfo"""
+class Address(typing.NamedTuple):
+    """Flattened representation of the tuple returned by socket.getaddrinfo"""
 
     Sockaddr = tuple[str, int] | tuple[str, int, int, int]
+    Info = tuple[socket.AddressFamily, socket.SocketKind, int, str, Sockaddr]
+
+    family: socket.AddressFamily
+    type: socket.SocketKind
+    proto: int
+    canonname: str
+    sockaddr: Sockaddr
+    address: str
+    port: Port
 
-    data: tuple[socket.AddressFamily, socket.SocketKind, int, str, Sockaddr]
-
-    @property
-    def family(self) -> socket.AddressFamily:
-        return self.data[0]
-
-    @property
-    def type(self) -> socket.SocketKind:
-        return self.data[1]
-
-    @property
-    def proto(self) -> int:
-        return self.data[2]
+    @classmethod
+    def from_info(cls, info: Info) -> "Address":
+        family, type, proto, canonname, sockaddr = info
+        address, port = sockaddr[0], Port(sockaddr[1])
 
-    @property
-    def canonname(self) -> str:
-        return self.data[3]
+        return cls(family, type, proto, canonname, sockaddr, address, port)
 
-    @property
-    def sockaddr(self) -> Sockaddr:
-        return self.data[4]
 
-    @property
-    def address(self) -> str:
-        return self.sockaddr[0]
+@functools.lru_cache(maxsize = 1024)
+def _resolve(host: str, port: int) -> tuple[Address, ...]:
+    """Cached address resolution, shared by every Host with the same hostport"""
 
-    @property
-    def port(self) -> Port:
-        return Port(self.sockaddr[1])
+    addresses = socket.getaddrinfo(host, port, proto = socket.IPPROTO_TCP)
+    return tuple(Address.from_info(address) for address in addresses)
 
 
 class _Regex:
     """Regex to match IPv4:PORT or [IPv6]:PORT or HOSTNAME:PORT"""
 
-    PORT = "\d+"
+    PORT = r"\d+"
 
-    IPV4 = "(?:\d{1,3}\.){3}\d{1,3}"
-    IPV6 = "\[[:a-fA-F0-9]+\]" # Incorrect oversimplification
-    HOSTNAME = "[-a-zA-Z0-9.]+"
+    IPV4 = r"(?:\d{1,3}\.){3}\d{1,3}"
+    IPV6 = r"\[[:a-fA-F0-9]+\]" # Incorrect oversimplification
+    HOSTNAME = r"[-a-zA-Z0-9.]+"
 
-    PATTERN = re.compile(f"({IPV4}|{IPV6}|{HOSTNAME}):({PORT})")
+    # ASCII only classes, skipping the Unicode tables for '\d'
+    PATTERN = re.compile(rf"({IPV4}|{IPV6}|{HOSTNAME}):({PORT})", re.ASCII)
 
     @classmethod
     def match(cls, hostport: str) -> re.Match[str] | None:
-        return cls.PATTERN.match(hostport)
+        # Anchored at both ends, trailing characters are rejected
+        return cls.PATTERN.fullmatch(hostport)
 
 
-@dataclasses.dataclass(frozen = True)
+@dataclasses.dataclass(frozen = True, slots = True)
 class Host:
     """Wrapper to represent a host with valid addressess"""
 
     host: str
     port: Port
-    addresses: list[Address] = dataclasses.field(init = False)
+    addresses: tuple[Address, ...] = dataclasses.field(init = False)
 
     def __post_init__(self) -> None:
         try:
-            addresses = socket.getaddrinfo(
-                self.host,
-                self.port.number,
-                proto = socket.IPPROTO_TCP
-            )
+            addresses = _resolve(self.host, self.port.number)
         except socket.gaierror:
             raise ValueError(f"Failed to get host address information: {self}")
 
-        object.__setattr__(
-            self,
-            "addresses",
-            [Address(address) for address in addresses]
-        )
+        object.__setattr__(self, "addresses", addresses)
 
     @classmethod
     def from_hostport(cls, hostport: str) -> "Host":
@@ -129,9 +117,8 @@ class Host:
         if not filepath.is_file():
             raise ValueError(f"Invalid text file: {filepath}")
 
-        with filepath.open() as hostfile:
-            hostports = hostfile.read().strip().split()
-
+        # split() already ignores the surrounding white space
+        hostports = filepath.read_text().split()
         return [cls.from_hostport(hostport) for hostport in hostports]
 
     def __str__(self) -> str:
@@ -1,6 +1,8 @@
 import uuid
 import asyncio
 import logging
+import itertools
+import contextlib
 import collections.abc
 
 from util import error
@@ -24,6 +26,7 @@ class Mediator:
         self._server: asyncio.Server | None = None
 
         # Connection maps
+        self._uids = itertools.count() # Client uids, no randomness needed
         self._clients = connection.Map()
         self._servers = connection.Map()
         self._clients.on_fail(self._on_client_fail)
@@ -49,6 +52,7 @@ class Mediator:
             self._server = await asyncio.start_server(
                 self._greet,
                 port = port.number,
+                limit = connection.LIMIT,
                 start_serving = True,
             )
         except Exception:
@@ -69,16 +73,36 @@ class Mediator:
     async def send(self, uid: uuid.UUID, message: message.Message) -> None:
         """Sends the message to the client or server with the uid"""
 
-        logging.debug(f"Sending to [{uid}]: {message}")
+        logging.debug("Sending to [%s]: %s", uid, message)
 
         if uid in self._servers:
             await self._servers.send(uid, message)
         else:
             await self._clients.send(uid, message)
 
+    async def multicast(
+        self,
+        uids: collections.abc.Iterable[uuid.UUID],
+        message: message.Message,
+    ) -> None:
+        """Sends the message to the clients or servers with the uids"""
+
+        uids = list(uids) # Iterated twice below
+        logging.debug("Sending to %s: %s", uids, message)
+
+        servers = [uid for uid in uids if uid in self._servers]
+        clients = [uid for uid in uids if uid not in self._servers]
+
+        # Encoded once per map instead of once per uid
+        if servers:
+            await self._servers.multicast(servers, message)
+
+        if clients:
+            await self._clients.multicast(clients, message)
+
     async def quorum(self, message: message.Message) -> None:
         """Sends the message to all the connected servers"""
-        logging.debug(f"Sending to Quorum: {message}")
+        logging.debug("Sending to Quorum: %s", message)
         await self._servers.broadcast(message)
 
     async def done(self) -> None:
@@ -138,15 +162,16 @@ class Mediator:
             return await fail(writer, str(exception))
 
         if (
-            isinstance(received, security.Authenticated) and
+            type(received) in message.AUTHENTICATED and
             not security.authenticate(received)
         ):
             reason = "Authentication failed"
 
-            try:
+            # A 'return' in 'finally' would also swallow a cancellation
+            with contextlib.suppress(Exception):
                 await message.send(writer, message.Denied(reason = reason))
-            finally:
-                return await fail(writer, reason)
+
+            return await fail(writer, reason)
 
         match received:
             case message.Server():
@@ -159,7 +184,7 @@ class Mediator:
 
                 uid = uuid.UUID(int = received.uid)
                 await self._servers.set_reader(uid, reader, writer)
-                logging.debug(f"Successfull greeting with server: [{uid}]")
+                logging.debug("Successfull greeting with server: [%s]", uid)
 
             case message.Client():
                 try:
@@ -167,18 +192,18 @@ class Mediator:
                 except Exception as exception:
                     return await fail(writer, str(exception))
 
-                uid = uuid.uuid4()
+                uid = uuid.UUID(int = next(self._uids))
                 await self._clients.set_writer(uid, writer)
                 await self._clients.set_reader(uid, reader, writer)
-                logging.debug(f"Successfull greeting with client: [{uid}]")
+                logging.debug("Successfull greeting with client: [%s]", uid)
 
             case _:
                 reason = f"Unexpected greeting message: '{type(received)}'"
 
-                try:
+                with contextlib.suppress(Exception):
                     await message.send(writer, message.Denied(reason = reason))
-                finally:
-                    return await fail(writer, reason)
+
+                return await fail(writer, reason)
 
     async def _receive(
         self,
@@ -187,10 +212,10 @@ class Mediator:
     ) -> None:
         """Callback for received messages"""
 
-        logging.debug(f"Received from [{sender}]: {received}")
+        logging.debug("Received from [%s]: %s", sender, received)
 
         if (
-            isinstance(received, security.Authenticated) and
+            type(received) in message.AUTHENTICATED and
             not security.authenticate(received)
         ):
             await self.send(sender, message.Denied(
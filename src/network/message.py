@@ -1,76 +1,78 @@
 import enum
-import json
+import types
 import struct
 import typing
 import asyncio
+import functools
 import dataclasses
+import collections.abc
 
 from app import security
 
 
-@dataclasses.dataclass(frozen = True)
+@dataclasses.dataclass(frozen = True, slots = True)
 class _Base:
     def __str__(self) -> str:
-        items = dataclasses.asdict(self).items()
-        values = (str(value) for field, value in items if field != "hash")
+        fields = (field for field in _FIELDS[type(self)] if field != "hash")
+        values = (str(getattr(self, field)) for field in fields)
         return f"{self.__class__.__name__}({', '.join(values)})"
 
 
-@dataclasses.dataclass(frozen = True)
+@dataclasses.dataclass(frozen = True, slots = True)
 class Accept(_Base, security.Authenticated):
     value: str
     proposal: int
 
-@dataclasses.dataclass(frozen = True)
+@dataclasses.dataclass(frozen = True, slots = True)
 class Accepted(_Base, security.Authenticated):
     value: str
     proposal: int
 
-@dataclasses.dataclass(frozen = True)
+@dataclasses.dataclass(frozen = True, slots = True)
 class Acknowledge(_Base):
     pass
 
-@dataclasses.dataclass(frozen = True)
+@dataclasses.dataclass(frozen = True, slots = True)
 class Client(_Base):
     pass
 
-@dataclasses.dataclass(frozen = True)
+@dataclasses.dataclass(frozen = True, slots = True)
 class Denied(_Base):
     reason: str
 
-@dataclasses.dataclass(frozen = True)
+@dataclasses.dataclass(frozen = True, slots = True)
 class Found(_Base, security.Authenticated):
     value: str
     found: bool
 
-@dataclasses.dataclass(frozen = True)
+@dataclasses.dataclass(frozen = True, slots = True)
 class Learn(_Base):
     value: str
 
-@dataclasses.dataclass(frozen = True)
+@dataclasses.dataclass(frozen = True, slots = True)
 class Prepare(_Base, security.Authenticated):
     proposal: int
 
-@dataclasses.dataclass(frozen = True)
+@dataclasses.dataclass(frozen = True, slots = True)
 class Promise(_Base, security.Authenticated):
     proposal: int
     accepted: str
     previous: int | None
 
-@dataclasses.dataclass(frozen = True)
+@dataclasses.dataclass(frozen = True, slots = True)
 class Search(_Base):
     value: str
     recurse: bool
 
-@dataclasses.dataclass(frozen = True)
+@dataclasses.dataclass(frozen = True, slots = True)
 class Server(_Base, security.Authenticated):
     uid: int
 
-@dataclasses.dataclass(frozen = True)
+@dataclasses.dataclass(frozen = True, slots = True)
 class Write(_Base):
     value: str
 
-@dataclasses.dataclass(frozen = True)
+@dataclasses.dataclass(frozen = True, slots = True)
 class Wrote(_Base):
     value: str
 
@@ -80,6 +82,18 @@ Message = (
     Prepare | Promise | Search | Server | Write | Wrote
 )
 
+# Messages carrying a hash, checked by type instead of walking the MRO
+AUTHENTICATED: frozenset[type[Message]] = frozenset(
+    cls for cls in typing.get_args(Message)
+    if issubclass(cls, security.Authenticated)
+)
+
+# All fields are flat, no need for the recursive copy of 'dataclasses.asdict'
+_FIELDS: dict[type, tuple[str, ...]] = {
+    cls: tuple(field.name for field in dataclasses.fields(cls))
+    for cls in typing.get_args(Message)
+}
+
 
 class Type(enum.Enum):
     ACCEPT      = enum.auto()
@@ -98,104 +112,272 @@ class Type(enum.Enum):
 
     @classmethod
     def from_message(cls, message: Message) -> "Type":
-        match message:
-            case Accept():
-                return cls.ACCEPT
-            case Accepted():
-                return cls.ACCEPTED
-            case Acknowledge():
-                return cls.ACKNOWLEDGE
-            case Client():
-                return cls.CLIENT
-            case Denied():
-                return cls.DENIED
-            case Found():
-                return cls.FOUND
-            case Learn():
-                return cls.LEARN
-            case Prepare():
-                return cls.PREPARE
-            case Promise():
-                return cls.PROMISE
-            case Search():
-                return cls.SEARCH
-            case Server():
-                return cls.SERVER
-            case Write():
-                return cls.WRITE
-            case Wrote():
-                return cls.WROTE
+        try:
+            return _TYPES[type(message)]
+        except KeyError:
+            raise ValueError(f"Unknown message: {type(message)}") from None
+
+    @classmethod
+    def from_value(cls, value: int) -> "Type":
+        try:
+            return _VALUES[value]
+        except KeyError:
+            raise ValueError(f"Unknown message type value: {value}") from None
 
     def to_type(self) -> type[Message]:
-        match self:
-            case self.ACCEPT:
-                return Accept
-            case self.ACCEPTED:
-                return Accepted
-            case self.ACKNOWLEDGE:
-                return Acknowledge
-            case self.CLIENT:
-                return Client
-            case self.DENIED:
-                return Denied
-            case self.FOUND:
-                return Found
-            case self.LEARN:
-                return Learn
-            case self.PREPARE:
-                return Prepare
-            case self.PROMISE:
-                return Promise
-            case self.SEARCH:
-                return Search
-            case self.SERVER:
-                return Server
-            case self.WRITE:
-                return Write
-            case self.WROTE:
-                return Wrote
-
-        raise ValueError(f"Unknown message type: {self}")
-
-
-@dataclasses.dataclass(frozen = True)
+        try:
+            return _MESSAGES[self]
+        except KeyError:
+            raise ValueError(f"Unknown message type: {self}") from None
+
+
+# Hashed lookups instead of matching the class patterns one by one
+_TYPES: dict[type[Message], Type] = {
+    Accept:      Type.ACCEPT,
+    Accepted:    Type.ACCEPTED,
+    Acknowledge: Type.ACKNOWLEDGE,
+    Client:      Type.CLIENT,
+    Denied:      Type.DENIED,
+    Found:       Type.FOUND,
+    Learn:       Type.LEARN,
+    Prepare:     Type.PREPARE,
+    Promise:     Type.PROMISE,
+    Search:      Type.SEARCH,
+    Server:      Type.SERVER,
+    Write:       Type.WRITE,
+    Wrote:       Type.WROTE,
+}
+
+_MESSAGES: dict[Type, type[Message]] = {
+    type: message for message, type in _TYPES.items()
+}
+
+# Skips the enum call machinery when decoding the headers
+_VALUES: dict[int, Type] = {type.value: type for type in Type}
+
+
+@dataclasses.dataclass(frozen = True, slots = True)
 class Header:
     type: Type
     length: int
 
-    SIZE: typing.ClassVar[int] = 5
-    _PACK: typing.ClassVar[str] = "!IB"
+    _STRUCT: typing.ClassVar[struct.Struct] = struct.Struct("!IB")
+    SIZE: typing.ClassVar[int] = _STRUCT.size
 
     def encode(self) -> bytes:
-        return struct.pack(self._PACK, self.length, self.type.value)
+        return self._STRUCT.pack(self.length, self.type.value)
 
     @classmethod
     def decode(cls, encoded: bytes) -> "Header":
         if len(encoded) != cls.SIZE:
             raise ValueError("Invalid encoded message header length")
 
-        length, type = struct.unpack(cls._PACK, encoded)
-        return cls(length = length, type = Type(type))
+        length, type = cls._STRUCT.unpack(encoded)
+        return cls(length = length, type = Type.from_value(type))
 
+    @classmethod
+    def decode_from(cls, buffer: bytearray, offset: int = 0) -> "Header":
+        """Decodes the header in place, without slicing it out of the buffer"""
+
+        length, type = cls._STRUCT.unpack_from(buffer, offset)
+        return cls(length = length, type = Type.from_value(type))
+
+
+class _Codec:
+    """Fixed binary layout of a message type: the string lengths and the
+    fixed size fields packed by a single struct, then the utf-8 strings.
+
+    Like the dataclass methods, the encoder and decoder are generated once
+    per type, so no field list is walked per message."""
+
+    _MASK = (1 << 64) - 1 # Proposals and uids take up to 128 bits
+
+    _FORMATS: dict[type | types.UnionType, str] = {
+        bool: "?",
+        int: "QQ",
+        int | None: "?QQ",
+    }
+
+    encode: collections.abc.Callable[[Message], bytes]
+    frame: collections.abc.Callable[[Message], bytes]
+    decode: collections.abc.Callable[[bytes | bytearray | memoryview], Message]
+
+    def __init__(self, cls: type[Message]) -> None:
+        fields = dataclasses.fields(cls)
+        strings = [field.name for field in fields if field.type is str]
+        fixed = [field for field in fields if field.type is not str]
+
+        for field in fixed:
+            if field.type not in self._FORMATS:
+                raise TypeError(f"Unable to encode field: '{field.name}'")
+
+        layout = "".join(self._FORMATS[field.type] for field in fixed)
+        packer = struct.Struct("!" + "I" * len(strings) + layout)
+
+        # Expressions packed when encoding and names unpacked when decoding,
+        # in the struct order, plus the field values rebuilt when decoding
+        packed = [f"len(s_{name})" for name in strings]
+        unpacked = [f"n_{name}" for name in strings]
+        rebuilt = {name: f"s_{name}" for name in strings}
+
+        for field in fixed:
+            value, high, low = (f"{prefix}_{field.name}" for prefix in "vhl")
+
+            if field.type is bool:
+                packed.append(value)
+                unpacked.append(value)
+                rebuilt[field.name] = value
+                continue
+
+            if field.type is int:
+                packed += [f"{value} >> 64", f"{value} & MASK"]
+                unpacked += [high, low]
+                rebuilt[field.name] = f"{high} << 64 | {low}"
+                continue
+
+            present = f"p_{field.name}"
+            packed.append(f"{value} is not None")
+            packed += [f"({value} or 0) >> 64", f"({value} or 0) & MASK"]
+            unpacked += [present, high, low]
+            optional = f"{high} << 64 | {low}"
+            rebuilt[field.name] = f"{optional} if {present} else None"
+
+        joined = "".join(f"s_{name}, " for name in strings)
+        lengths = "".join(f" + len(s_{name})" for name in strings)
+        targets = "".join(f"{name}, " for name in unpacked)
+        # Positional where possible, binding them skips the keyword matching
+        positional = [field for field in fields if not field.kw_only]
+        keyword = [field for field in fields if field.kw_only]
+
+        arguments = ", ".join(
+            [rebuilt[field.name] for field in positional] +
+            [f"{field.name} = {rebuilt[field.name]}" for field in keyword]
+        )
+
+        body = [
+            *(f"    s_{name} = message.{name}.encode()" for name in strings),
+            *(f"    v_{field.name} = message.{field.name}" for field in fixed),
+            f"    packed = pack({', '.join(packed)})",
+        ]
+
+        encode = [
+            "def encode(message):",
+            *body,
+            f"    return b''.join((packed, {joined}))",
+        ]
+
+        # Whole frame, the header joined in the same single copy
+        frame = [
+            "def frame(message):",
+            *body,
+            f"    length = SIZE{lengths}",
+            f"    return b''.join((header(length, KIND), packed, {joined}))",
+        ]
+
+        decode = [
+            "def decode(payload):",
+            f"    ({targets}) = unpack(payload)",
+            "    offset = SIZE",
+        ]
+
+        for name in strings:
+            decode += [
+                f"    end = offset + n_{name}",
+                f"    s_{name} = str(payload[offset:end], 'utf-8')",
+                "    offset = end",
+            ]
+
+        decode += [
+            "    if offset != len(payload):",
+            "        raise ValueError('Invalid encoded message payload')",
+            f"    return cls({arguments})",
+        ]
+
+        namespace: dict[str, typing.Any] = {
+            "cls": cls,
+            "MASK": self._MASK,
+            "SIZE": packer.size,
+            "pack": packer.pack,
+            "unpack": packer.unpack_from,
+            "header": Header._STRUCT.pack,
+            "KIND": _TYPES[cls].value,
+        }
+
+        exec("\n".join(encode + frame + decode), namespace)
+
+        self.encode = namespace["encode"]
+        self.frame = namespace["frame"]
+        self.decode = namespace["decode"]
+
+_CODECS: dict[type[Message], _Codec] = {
+    cls: _Codec(cls) for cls in typing.get_args(Message)
+}
+
+def _payload(message: Message) -> bytes:
+    return _CODECS[type(message)].encode(message)
+
+def _frame(message: Message) -> tuple[bytes, bytes]:
+    """Encodes the header and the payload separately"""
+
+    payload = _payload(message)
+    header = Header(length = len(payload), type = _TYPES[type(message)])
+    return header.encode(), payload
+
+def _encode(message: Message) -> bytes:
+    # Header, fields and strings joined at once, without a payload copy
+    return _CODECS[type(message)].frame(message)
+
+# Messages with few distinct contents, serialized once and reused
+_STATIC = (Acknowledge, Client, Denied)
+_encode_static = functools.lru_cache(maxsize = 64)(_encode)
 
 def encode(message: Message) -> bytes:
-    payload = json.dumps(dataclasses.asdict(message)).encode()
-    header = Header(length = len(payload), type = Type.from_message(message))
-    return header.encode() + payload
+    if isinstance(message, _STATIC):
+        return _encode_static(message)
+
+    return _encode(message)
 
-def decode(header: Header, payload: bytes) -> Message:
+def decode(header: Header, payload: bytes | bytearray | memoryview) -> Message:
     if len(payload) != header.length:
         raise ValueError("Invalid encoded message length")
 
-    type = header.type.to_type()
-    decoded = json.loads(payload)
+    # Header types are validated on decoding, the lookups always succeed
+    return _CODECS[_MESSAGES[header.type]].decode(payload)
 
-    return type(**typing.cast(dict[str, typing.Any], decoded))
+def decode_frames(buffer: bytearray) -> list[Message]:
+    """Decodes and removes every complete message at the buffer start"""
+
+    decoded: list[Message] = []
+    offset = 0
+
+    # Payloads are decoded through a view, without copying them out first
+    with memoryview(buffer) as view:
+        while len(buffer) - offset >= Header.SIZE:
+            header = Header.decode_from(buffer, offset)
+            end = offset + Header.SIZE + header.length
+
+            if len(buffer) < end:
+                break
+
+            decoded.append(decode(header, view[offset + Header.SIZE:end]))
+            offset = end
+
+    # Only resizable once the view is released
+    del buffer[:offset]
+    return decoded
 
 
 async def send(writer: asyncio.StreamWriter, message: Message) -> None:
-    writer.write(encode(message))
-    await writer.drain()
+    # The transport gathers both parts, without joining them here first
+    writer.writelines(_frame(message))
+
+    # Only round-trip through the loop under backpressure, or to surface the
+    # error of a closing writer
+    transport = writer.transport
+    _, high = transport.get_write_buffer_limits()
+
+    if writer.is_closing() or transport.get_write_buffer_size() > high:
+        await writer.drain()
 
 async def receive(reader: asyncio.StreamReader) -> Message:
     initial = await reader.readexactly(Header.SIZE)
@@ -4,10 +4,13 @@ import asyncio
 import logging
 import pathlib
 
+from util import log
+from util import loop
 from util import error
 
 from network import host
 from network import mediator
+from network import connection
 
 from app import cli
 from app import paxos
@@ -16,38 +19,63 @@ from app import security
 
 
 async def main() -> None:
-    logging.root.level = logging.DEBUG
+    log.setup(logging.DEBUG)
+    loop.setup()
 
     parsed = cli.Parser().server.parse_args()
-    logging.debug(f"Selected port: {parsed.port}")
+    logging.debug("Selected port: %s", parsed.port)
 
     try:
         hosts = host.Host.from_hostfile(parsed.hostfile)
     except Exception as exception:
         error.exit(str(exception))
 
-    logging.debug(f"Hosts: [{', '.join(map(str, hosts))}]")
+    # The join is not deferred by the logger, skip it when it is not shown
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug("Hosts: [%s]", ", ".join(map(str, hosts)))
 
     try:
         store = storage.Storage(pathlib.Path(f"{parsed.port}.txt"))
     except Exception as exception:
         error.exit(f"Failed to open storage: {exception}")
 
-    uid = security.Context().uid
-    logging.debug(f"Generated UID: {uid}")
+    context = security.Context()
 
-    secret = security.Context().secret
-    logging.debug(f"Detected secret: {'*' * len(secret)}")
+    uid = context.uid
+    logging.debug("Generated UID: %s", uid)
 
-    async with mediator.Mediator(hosts) as server:
-        handler = paxos.Handler(store, server, (2.0, 5.0))
+    secret = context.secret
+    logging.debug("Detected secret: %s", "*" * len(secret))
 
-        await server.start(parsed.port, [0.1, 1.0, 2.0, 5.0], handler.handle)
-        await server.done()
+    with store:
+        async with mediator.Mediator(hosts) as server:
+            handler = paxos.Handler(store, server, (2.0, 5.0))
+
+            await server.start(
+                parsed.port,
+                connection.Backoff(),
+                handler.handle,
+            )
+
+            await server.done()
 
 
 if __name__ == "__main__":
+    # Prefer the libuv event loop, falling back to the default one
+    try:
+        import uvloop # type: ignore
+    except ImportError:
+        uvloop = None
+
     try:
-        asyncio.run(main())
+        if uvloop is None:
+            asyncio.run(main())
+        elif hasattr(asyncio, "Runner"): # Python 3.11+
+            # Scoped to this run, without replacing the global policy
+            with asyncio.Runner(loop_factory = uvloop.new_event_loop) as runner:
+                runner.run(main())
+        else:
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+            asyncio.run(main())
     except KeyboardInterrupt:
         pass
@@ -19,24 +19,49 @@ class Callback(typing.Generic[_Params]):
     def __init__(self, handler: Handler[_Params] = None) -> None:
         self.handler = handler
 
+    @property
+    def handler(self) -> Handler[_Params]:
+        return self._handler
+
+    @handler.setter
+    def handler(self, handler: Handler[_Params]) -> None:
+        """Specializes the invocation once instead of inspecting every call"""
+
+        self._handler = handler
+        self._coroutine: _Coroutine[_Params] | None = None
+        self._callable: collections.abc.Callable[_Params, None] | None = None
+
+        if inspect.iscoroutinefunction(handler):
+            self._coroutine = typing.cast(_Coroutine[_Params], handler)
+        elif handler is not None:
+            self._callable = typing.cast(
+                collections.abc.Callable[_Params, None],
+                handler,
+            )
+
+    @property
+    def synchronous(self) -> bool:
+        """Whether the handler can be invoked through 'call' without awaiting"""
+        return self._coroutine is None
+
+    def call(self, *args: _Params.args, **kwargs: _Params.kwargs) -> None:
+        """Invokes a synchronous handler without creating a coroutine"""
+
+        if self._coroutine is not None:
+            raise TypeError("Coroutine function handlers must be awaited")
+
+        if self._callable is not None:
+            self._callable(*args, **kwargs)
+
     def __bool__(self) -> bool:
-        return self.handler is not None
+        return self._handler is not None
 
     async def __call__(
         self,
         *args: _Params.args,
         **kwargs: _Params.kwargs
     ) -> None:
-        if self.handler is None:
-            return
-
-        if inspect.iscoroutinefunction(self.handler):
-            coroutine = typing.cast(_Coroutine[_Params], self.handler)
-            return await coroutine(*args, **kwargs)
-
-        callable = typing.cast(
-            collections.abc.Callable[_Params, None],
-            self.handler,
-        )
-
-        callable(*args, **kwargs)
+        if self._coroutine is not None:
+            await self._coroutine(*args, **kwargs)
+        elif self._callable is not None:
+            self._callable(*args, **kwargs)
@@ -0,0 +1,22 @@
+import sys
+import queue
+import atexit
+import logging
+import logging.handlers
+
+
+def setup(level: int) -> None:
+    """Routes the root logger through a queue written in the background"""
+
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+
+    records: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(records, handler)
+
+    logging.root.addHandler(logging.handlers.QueueHandler(records))
+    logging.root.setLevel(level)
+
+    # Flushes the pending records on exit
+    listener.start()
+    atexit.register(listener.stop)
@@ -0,0 +1,9 @@
+import asyncio
+
+
+def setup() -> None:
+    """Starts the tasks of the running loop eagerly, where supported"""
+
+    # Skips a loop iteration for the tasks that finish before awaiting
+    if hasattr(asyncio, "eager_task_factory"): # Python 3.12+
+        asyncio.get_running_loop().set_task_factory(asyncio.eager_task_factory)
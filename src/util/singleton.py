@@ -8,7 +8,11 @@ class Singleton(type):
     _instances: dict["Singleton", typing.Any] = {}
 
     def __call__(self, *args: typing.Any, **kwargs: typing.Any) -> typing.Any:
-        if self not in self._instances:
-            self._instances[self] = super().__call__(*args, **kwargs)
+        # Single lookup once created, which is nearly every call
+        instance = self._instances.get(self)
 
-        return self._instances[self]
+        if instance is None:
+            instance = super().__call__(*args, **kwargs)
+            self._instances[self] = instance
+
+        return instance